@@ -0,0 +1,44 @@
+import sqlite3
+import orjson
+
+# Bump when the stored value format changes; older tables are discarded
+SCHEMA_VERSION = 2
+
+class OCRCache:
+    """
+    Persistent store of extraction results keyed by image content hash.
+    Values are JSON-serializable objects, stored as orjson-encoded bytes.
+    """
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        # WAL lets several runs read and write the cache at the same time
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS ocr_cache")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, value BLOB)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        row = self.conn.execute(
+            "SELECT value FROM ocr_cache WHERE key = ?", (key,)
+        ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        """
+        Store the value for key
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (key, value) VALUES (?, ?)",
+            (key, orjson.dumps(value)),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import text_extractor
+from cache import OCRCache
+from text_extractor import MODEL_TIERS, estimate_request_tokens, split_batch_response, validate_extraction
+
+SAMPLE_OUTPUT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extracted_text", "extracted_text_20250802_195214.txt",
+)
+
+def load_sample_sections():
+    """
+    Return the extracted text of each image in the committed sample output
+    """
+    with open(SAMPLE_OUTPUT, encoding='utf-8') as f:
+        content = f.read()
+    sections = re.split(r'^IMAGE \d+: .*\n-{60}\n', content, flags=re.MULTILINE)[1:]
+    return [section.split("\n\n" + "=" * 80)[0] for section in sections]
+
+SAMPLE_SECTIONS = load_sample_sections()
+
+def test_sample_output_has_every_image():
+    assert len(SAMPLE_SECTIONS) == 6
+
+@pytest.mark.parametrize("text", SAMPLE_SECTIONS)
+def test_validate_accepts_sample_reports(text):
+    assert validate_extraction(text)
+
+def test_validate_rejects_malformed_reading():
+    text = SAMPLE_SECTIONS[0].replace("H17 230°F 07P", "H17 23O°F 07P")
+    assert not validate_extraction(text)
+
+def test_validate_rejects_missing_field():
+    lines = [line for line in SAMPLE_SECTIONS[0].splitlines() if not line.startswith("PROG")]
+    assert not validate_extraction("\n".join(lines))
+
+def test_split_batch_response_round_trips_sample():
+    texts = [section.strip() for section in SAMPLE_SECTIONS]
+    response = "\n".join(f"===IMAGE {k}===\n{text}" for k, text in enumerate(texts, 1))
+    assert split_batch_response(response, len(texts)) == texts
+
+def test_split_batch_response_strips_wrapping_fence():
+    texts = ["H01 068°F 00P", "H01 131°F 00P"]
+    response = "```\n===IMAGE 1===\nH01 068°F 00P\n===IMAGE 2===\nH01 131°F 00P\n```"
+    assert split_batch_response(response, 2) == texts
+
+def test_split_batch_response_rejects_missing_image():
+    response = "===IMAGE 1===\nH01 068°F 00P\n===IMAGE 3===\nH01 131°F 00P"
+    assert split_batch_response(response, 2) is None
+
+def test_estimate_charges_mini_image_tokens():
+    # gpt-4o-mini bills images at far more tokens than gpt-4o
+    assert estimate_request_tokens('gpt-4o-mini') > 5 * estimate_request_tokens('gpt-4o')
+    assert estimate_request_tokens('gpt-4o', 4) > estimate_request_tokens('gpt-4o', 1)
+
+class FakeCompletions:
+    """
+    Stand-in for client.chat.completions that answers each image with
+    respond(model, image_url) and records the models asked for each image
+    """
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    async def create(self, model, messages, max_tokens):
+        image_urls = [part["image_url"]["url"] for part in messages[0]["content"][1:]]
+        self.calls.append((model, image_urls))
+        texts = [self.respond(model, image_url) for image_url in image_urls]
+        if len(texts) == 1:
+            content = texts[0]
+        else:
+            content = "\n".join(f"===IMAGE {k}===\n{text}" for k, text in enumerate(texts, 1))
+        choice = SimpleNamespace(message=SimpleNamespace(content=content), finish_reason='stop')
+        return SimpleNamespace(choices=[choice], usage=None)
+
+    def models_for(self, image_url):
+        return [model for model, image_urls in self.calls if image_url in image_urls]
+
+@pytest.fixture
+def completions(monkeypatch):
+    def install(respond):
+        fake = FakeCompletions(respond)
+        monkeypatch.setattr(text_extractor.client.chat, "completions", fake)
+        return fake
+    return install
+
+def run_batch(tmp_path, image_paths):
+    """
+    Run process_batch over image_paths at the first tier and return its
+    results ordered by index
+    """
+    batch = [
+        (i, image_path, tuple(f"{image_path}:{model}" for model in MODEL_TIERS))
+        for i, image_path in enumerate(image_paths, 1)
+    ]
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    try:
+        results = asyncio.run(text_extractor.process_batch(
+            asyncio.Semaphore(4), asyncio.Semaphore(4), None, cache, batch, 0, len(batch),
+        ))
+    finally:
+        cache.close()
+    return sorted(results)
+
+def test_unreadable_image_only_fails_itself(tmp_path, completions):
+    image_paths = []
+    for name in ("a", "b", "c"):
+        image_path = str(tmp_path / f"{name}.jpg")
+        Image.new("RGB", (32, 32), "white").save(image_path)
+        image_paths.append(image_path)
+    broken = tmp_path / "d.jpg"
+    broken.write_bytes(b"not an image")
+    image_paths.append(str(broken))
+    fake = completions(lambda model, image_url: SAMPLE_SECTIONS[0])
+
+    results = run_batch(tmp_path, image_paths)
+
+    assert [model for _, _, model in results] == [MODEL_TIERS[0]] * 3 + [None]
+    assert all(validate_extraction(text) for _, text, _ in results[:3])
+    assert results[3][1].startswith(f"Error processing {broken}")
+    # The readable images still share a single request
+    assert len(fake.calls) == 1
+
+def test_only_invalid_images_move_to_next_tier(tmp_path, completions, monkeypatch):
+    monkeypatch.setattr(text_extractor, "inline_image_url", lambda image_path: image_path)
+
+    def respond(model, image_url):
+        if model == MODEL_TIERS[0] and image_url == "blurry.jpg":
+            return "H17 23O°F 07P"
+        return SAMPLE_SECTIONS[0]
+    fake = completions(respond)
+
+    results = run_batch(tmp_path, ["sharp.jpg", "blurry.jpg", "clear.jpg"])
+
+    assert [model for _, _, model in results] == [MODEL_TIERS[0], MODEL_TIERS[1], MODEL_TIERS[0]]
+    assert fake.models_for("blurry.jpg") == [MODEL_TIERS[0], MODEL_TIERS[1]]
+    assert fake.models_for("sharp.jpg") == [MODEL_TIERS[0]]
+    assert fake.models_for("clear.jpg") == [MODEL_TIERS[0]]
+
+def test_rejected_batch_is_retried_per_image(tmp_path, completions, monkeypatch):
+    monkeypatch.setattr(text_extractor, "inline_image_url", lambda image_path: image_path)
+
+    def respond(model, image_url):
+        if image_url == "bad.jpg":
+            raise ValueError("Invalid image")
+        return SAMPLE_SECTIONS[0]
+    fake = completions(respond)
+
+    results = run_batch(tmp_path, ["good.jpg", "bad.jpg", "fine.jpg"])
+
+    assert [model for _, _, model in results] == [MODEL_TIERS[0], None, MODEL_TIERS[0]]
+    # A rejected image is not the model's fault, so no other model is tried
+    assert fake.models_for("bad.jpg") == [MODEL_TIERS[0], MODEL_TIERS[0]]
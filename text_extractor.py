@@ -1,128 +1,515 @@
 import os
-import base64
+import re
+import time
+import argparse
+import pybase64
+import asyncio
+import hashlib
+import heapq
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, NotFoundError,
+    PermissionDeniedError, RateLimitError,
+)
 from PIL import Image
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import io
+from cache import OCRCache
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client. Retries are handled by request_completion, so
+# the client's own retry loop is disabled.
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+# Maximum number of API requests in flight at once
+MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+
+# Maximum number of requests prepared ahead of a free API slot. Keeps the
+# encoding workers busy without letting encoded payloads pile up in memory.
+MAX_PREPARED = 2 * MAX_CONCURRENCY
+
+# API errors worth retrying, and how many attempts to make in total
+TRANSIENT_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+MAX_ATTEMPTS = 5
+
+# API errors meaning the model itself is unavailable to this account; these
+# move a request on to the next model instead of failing its images
+MODEL_ERRORS = (NotFoundError, PermissionDeniedError)
+
+# Models tried in order, cheapest first. An image only moves on to the next
+# model when the previous one's text fails validate_extraction() or the
+# previous model cannot be used (MODEL_ERRORS).
+MODEL_TIERS = tuple(
+    model.strip() for model in (os.getenv('OPENAI_MODELS') or 'gpt-4o-mini,gpt-4o').split(',')
+    if model.strip()
+)
+if not MODEL_TIERS:
+    raise ValueError("OPENAI_MODELS must name at least one model")
+
+# Completion token cap per request
+MAX_OUTPUT_TOKENS = 4096
+
+# Expected completion tokens for one image, used to keep the combined output
+# of a batch within MAX_OUTPUT_TOKENS
+OUTPUT_TOKENS_PER_IMAGE_ESTIMATE = 512
+
+# Number of images sent together in one request
+BATCH_SIZE = max(1, min(int(os.getenv('OPENAI_BATCH_SIZE', '4')),
+                        MAX_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_IMAGE_ESTIMATE))
+
+def per_model_limits(name):
+    """
+    Read a per-minute limit for each model tier from the environment. A
+    single value applies to every model, a comma-separated list gives one
+    value per entry in MODEL_TIERS. Unset or 0 disables that limit.
+    """
+    values = [int(value) for value in os.getenv(name, '0').split(',')]
+    if len(values) == 1:
+        values *= len(MODEL_TIERS)
+    if len(values) != len(MODEL_TIERS):
+        raise ValueError(f"{name} must have one value, or one per model in OPENAI_MODELS")
+    return dict(zip(MODEL_TIERS, values))
+
+# Client-side rate limits, matching the account's per-minute API limits.
+# OpenAI limits each model separately, so every tier gets its own buckets.
+REQUESTS_PER_MINUTE = per_model_limits('OPENAI_RPM')
+TOKENS_PER_MINUTE = per_model_limits('OPENAI_TPM')
+request_limiters = {model: AsyncLimiter(limit, 60) for model, limit in REQUESTS_PER_MINUTE.items() if limit}
+token_limiters = {model: AsyncLimiter(limit, 60) for model, limit in TOKENS_PER_MINUTE.items() if limit}
+
+# Rough token costs used to charge the token limiter. Images cost a base
+# amount plus a per-512px-tile amount, which differs by model; unknown
+# models are charged the highest known cost. A high-detail image that fits
+# 2048px has at most 8 tiles after the 768px short-side rescale.
+PROMPT_TOKENS_ESTIMATE = 600
+IMAGE_TOKEN_COSTS = {
+    'gpt-4o': (85, 170),
+    'gpt-4o-mini': (2833, 5667),
+}
+MAX_IMAGE_TILES = 8
+
+# Instructions sent with every image
+OCR_PROMPT = """\
+You are an OCR extraction engine. Your task is to extract data from an autoclave image report. DIGIT ORDER AND ACCURACY ARE CRITICAL.
+
+⚠️ CRITICAL: READ EACH DIGIT FROM LEFT TO RIGHT. DO NOT REARRANGE DIGITS.
+Example: If you see '247', it must not become '274'. Each digit must stay in its exact position.
+
+READ AND EXTRACT EACH LINE INDIVIDUALLY. Follow these rules STRICTLY:
+
+1. Extract and write **each entry exactly** as it appears in the image.
+2. For every line in the format `[ID] [Temperature]°F [Pressure]`:
+   - READ **every digit** in the temperature and pressure carefully.
+   - Ensure °F is included.
+   - Do not skip lines. Even if a value is 000°F 00P, include it.
+3. Characters that can look similar (1, 7 / 3, 8 / 5, 6 / 0, 8) must be double-checked.
+4. Do NOT reformat, interpret, infer, or skip **any values**.
+5. Return the result **as-is** from the image. Preserve order.
+
+💡 Format:
+[ID] [Temp]°F [Pressure]
+
+✅ EXACT Examples - Check digit order carefully:
+H17 247°F 16P  (must be 247, NOT 274)
+H13 223°F 08P  (must be 223, NOT 232 or 273)
+H05 142°F 00P
+
+⚠️ CRITICAL TIME AND DRY FORMAT:
+These are two separate fields that must not be mixed up:
+DRY  :01MIN    (Dry time - exactly as shown)
+TIME :10MIN    (Time - exactly as shown)
+
+Other fields to extract EXACTLY if present:
+- AUTOCALVE NO
+- LOAD NO
+- OPERATOR
+- TEMP
+- PROG
+- DATE
+- Version
+
+⚠️ READ CAREFULLY:
+- DRY and TIME are different fields
+- Keep exact spacing and colons
+- Do not swap or combine these values
+- Extract each line independently
+
+ONLY RETURN RAW TEXT FROM IMAGE.
+DO NOT WRITE AN EXPLANATION, JUST RETURN RAW TEXT."""
+
+# Appended to the prompt when several images share one request
+BATCH_PROMPT = """
+
+You will receive {count} images. Extract the text of each image separately, following the rules above.
+Before the text of each image, write a line containing exactly ===IMAGE k===, where k is the image's position (1 to {count})."""
+
+# Separator line the model writes before each image's text in a batch
+BATCH_DELIMITER = re.compile(r'^===IMAGE (\d+)===[ \t]*$', re.MULTILINE)
+
+# A temperature/pressure reading such as "H17 247°F 16P" (some printers
+# omit the degree sign, e.g. "D76 195F 00P"), and any line that starts
+# like one
+READING_LINE = re.compile(r'^[A-Z]\d{2} \d{3}°?F \d{2}P$')
+READING_START = re.compile(r'^[A-Z]\d{2}\s')
+
+# Fields printed at the end of every report
+REQUIRED_FIELDS = ('DRY', 'TIME', 'TEMP', 'PROG', 'DATE')
+
+# Derived from the prompt text so cached results are invalidated whenever
+# the prompt changes
+PROMPT_VERSION = hashlib.blake2b((OCR_PROMPT + BATCH_PROMPT).encode(), digest_size=8).hexdigest()
+
+# File extensions picked up from the images directory
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'})
+
+# Largest image side sent to the API. GPT-4o scales images down to fit
+# 2048x2048 before tiling them, so anything larger is wasted upload.
+MAX_IMAGE_SIZE = 2048
+
+# JPEG quality used when re-encoding images for the API
+JPEG_QUALITY = 70
+
+# Image modes the JPEG encoder accepts without converting to RGB first
+JPEG_MODES = ('RGB', 'L')
+
+# Base URL the images are already published under (e.g. a bucket or static
+# file server mirroring the images directory). When set, the API fetches each
+# image from there instead of receiving it inline as base64.
+IMAGE_URL_BASE = os.getenv('IMAGE_URL_BASE')
+
+# Formats the vision API can fetch by URL; anything else is sent inline
+URL_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.gif'})
+
+# Write buffer for the output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Records the last successful API key check so repeated runs can skip it
+VERIFY_SENTINEL = os.path.join(os.path.expanduser('~'), '.cache', 'text_extractor', 'last_ok')
+VERIFY_TTL_SECONDS = 10 * 60
+
+# Location of the on-disk OCR result cache
+CACHE_PATH = os.getenv('OCR_CACHE_PATH', '.ocr_cache.db')
+
+def image_cache_keys(image_path):
+    """
+    Build one cache key per model tier from the image bytes, prompt version
+    and model, so results from different models are never mixed up
+    """
+    with open(image_path, 'rb') as f:
+        image_hash = hashlib.blake2b(f.read(), digest_size=16)
+    image_hash.update(PROMPT_VERSION.encode())
+    
+    keys = []
+    for model in MODEL_TIERS:
+        key = image_hash.copy()
+        key.update(model.encode())
+        keys.append(key.hexdigest())
+    return tuple(keys)
+
+def validate_extraction(text):
+    """
+    Check that extracted text looks like a complete autoclave report: there
+    is at least one reading, every reading line is well formed, and all of
+    REQUIRED_FIELDS are present
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    readings = [line for line in lines if READING_START.match(line)]
+    if not readings or not all(READING_LINE.match(line) for line in readings):
+        return False
+    
+    fields = {line.split(':', 1)[0].strip() for line in lines if ':' in line}
+    return all(field in fields for field in REQUIRED_FIELDS)
 
 def encode_image_to_base64(image_path):
     """
     Convert image to base64 string
     """
     with Image.open(image_path) as img:
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        width, height = img.size
         
-        # Resize if image is too large (max 8192x8192)
-        max_size = 8192
-        if img.size[0] > max_size or img.size[1] > max_size:
-            img.thumbnail((max_size, max_size))
+        # JPEGs that are already small enough are sent as-is, skipping the
+        # decode and re-encode entirely
+        if img.format == 'JPEG' and img.mode in JPEG_MODES and max(width, height) <= MAX_IMAGE_SIZE:
+            with open(image_path, 'rb') as f:
+                return pybase64.b64encode(f.read()).decode('ascii')
+        
+        # Resize if image is too large. Only the header has been read so far,
+        # so for JPEGs we can have libjpeg decode straight at the nearest
+        # 1/2, 1/4 or 1/8 scale that still covers the target size.
+        if max(width, height) > MAX_IMAGE_SIZE:
+            if img.format == 'JPEG':
+                scale = MAX_IMAGE_SIZE / max(width, height)
+                img.draft('RGB', (int(width * scale), int(height * scale)))
+            img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+        
+        # Convert to RGB if necessary. JPEGs drafted above already decode as
+        # RGB, and greyscale images are saved as-is, so neither needs a
+        # second full-size copy.
+        if img.mode not in JPEG_MODES:
+            img = img.convert('RGB')
         
         # Save to bytes
         buffered = io.BytesIO()
-        img.save(buffered, format="JPEG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        img.save(buffered, format="JPEG", quality=JPEG_QUALITY, subsampling=2,
+                 optimize=False, progressive=False)
+        return pybase64.b64encode(buffered.getvalue()).decode('ascii')
 
-def extract_text_from_image(image_path):
+def published_image_url(image_path):
     """
-    Extract text from image using GPT-4 Vision
+    Return the image's URL under IMAGE_URL_BASE, or None if it has to be sent
+    inline: no base URL is set, the API cannot read the format, or the image
+    is larger than MAX_IMAGE_SIZE
     """
-    try:
-        # Encode image
-        base64_image = encode_image_to_base64(image_path)
-        
-        # Create message for GPT-4 Vision
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": ("You are an OCR extraction engine. Your task is to extract data from an autoclave image report. DIGIT ORDER AND ACCURACY ARE CRITICAL.\n\n"
-                                   "⚠️ CRITICAL: READ EACH DIGIT FROM LEFT TO RIGHT. DO NOT REARRANGE DIGITS.\n"
-                                   "Example: If you see '247', it must not become '274'. Each digit must stay in its exact position.\n\n"
-                                   "READ AND EXTRACT EACH LINE INDIVIDUALLY. Follow these rules STRICTLY:\n\n"
-                                   "1. Extract and write **each entry exactly** as it appears in the image.\n"
-                                   "2. For every line in the format `[ID] [Temperature]°F [Pressure]`:\n"
-                                   "   - READ **every digit** in the temperature and pressure carefully.\n"
-                                   "   - Ensure °F is included.\n"
-                                   "   - Do not skip lines. Even if a value is 000°F 00P, include it.\n"
-                                   "3. Characters that can look similar (1, 7 / 3, 8 / 5, 6 / 0, 8) must be double-checked.\n"
-                                   "4. Do NOT reformat, interpret, infer, or skip **any values**.\n"
-                                   "5. Return the result **as-is** from the image. Preserve order.\n\n"
-                                   "💡 Format:\n"
-                                   "[ID] [Temp]°F [Pressure]\n\n"
-                                   "✅ EXACT Examples - Check digit order carefully:\n"
-                                   "H17 247°F 16P  (must be 247, NOT 274)\n"
-                                   "H13 223°F 08P  (must be 223, NOT 232 or 273)\n"
-                                   "H05 142°F 00P\n\n"
-                                   "⚠️ CRITICAL TIME AND DRY FORMAT:\n"
-                                   "These are two separate fields that must not be mixed up:\n"
-                                   "DRY  :01MIN    (Dry time - exactly as shown)\n"
-                                   "TIME :10MIN    (Time - exactly as shown)\n\n"
-                                   "Other fields to extract EXACTLY if present:\n"
-                                   "- AUTOCALVE NO\n"
-                                   "- LOAD NO\n"
-                                   "- OPERATOR\n"
-                                   "- TEMP\n"
-                                   "- PROG\n"
-                                   "- DATE\n"
-                                   "- Version\n\n"
-                                   "⚠️ READ CAREFULLY:\n"
-                                   "- DRY and TIME are different fields\n"
-                                   "- Keep exact spacing and colons\n"
-                                   "- Do not swap or combine these values\n"
-                                   "- Extract each line independently\n\n"
-                                   "ONLY RETURN RAW TEXT FROM IMAGE.\n"
-                                   "DO NOT WRITE AN EXPLANATION, JUST RETURN RAW TEXT.")
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=4096
+    if not IMAGE_URL_BASE or os.path.splitext(image_path)[1].lower() not in URL_IMAGE_EXTENSIONS:
+        return None
+    with Image.open(image_path) as img:
+        if max(img.size) > MAX_IMAGE_SIZE:
+            return None
+    return f"{IMAGE_URL_BASE.rstrip('/')}/{quote(os.path.basename(image_path))}"
+
+def inline_image_url(image_path):
+    """
+    Return the image as an inline base64 JPEG data URL
+    """
+    return f"data:image/jpeg;base64,{encode_image_to_base64(image_path)}"
+
+async def image_url_for(image_path, pool):
+    """
+    Return the URL the API should read the image from. Images that have to be
+    encoded are handled in a worker process so CPU work overlaps requests in
+    flight; published images skip the pool entirely.
+    """
+    image_url = published_image_url(image_path)
+    if image_url is not None:
+        return image_url
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, inline_image_url, image_path)
+
+def build_messages(image_urls):
+    """
+    Build the chat messages for one or more images
+    """
+    prompt = OCR_PROMPT
+    if len(image_urls) > 1:
+        prompt += BATCH_PROMPT.format(count=len(image_urls))
+    
+    content = [{"type": "text", "text": prompt}]
+    for image_url in image_urls:
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return [{"role": "user", "content": content}]
+
+def split_batch_response(text, count):
+    """
+    Split a batched response into one text per image, or return None if the
+    delimiters do not account for every image exactly once, in order
+    """
+    parts = BATCH_DELIMITER.split(text)
+    if [int(number) for number in parts[1::2]] != list(range(1, count + 1)):
+        return None
+    sections = [section.strip() for section in parts[2::2]]
+    
+    # A code fence around the whole response leaves its closing ``` on the
+    # last section
+    if parts[0].strip().startswith('```') and sections[-1].endswith('```'):
+        sections[-1] = sections[-1][:-3].rstrip()
+    return sections
+
+def estimate_request_tokens(model, image_count=1):
+    """
+    Estimate the tokens a request to model counts against the per-minute
+    limit, including the completion token cap
+    """
+    base_tokens, tile_tokens = IMAGE_TOKEN_COSTS.get(model, max(IMAGE_TOKEN_COSTS.values()))
+    image_tokens = base_tokens + tile_tokens * MAX_IMAGE_TILES
+    return PROMPT_TOKENS_ESTIMATE + image_count * image_tokens + MAX_OUTPUT_TOKENS
+
+async def wait_for_rate_limits(model, token_estimate):
+    """
+    Block until both the request and token budgets for model allow another
+    call
+    """
+    if model in request_limiters:
+        await request_limiters[model].acquire()
+    if model in token_limiters:
+        await token_limiters[model].acquire(min(token_estimate, TOKENS_PER_MINUTE[model]))
+
+@retry(
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(MAX_ATTEMPTS),
+    reraise=True,
+)
+async def request_completion(image_urls, model, semaphore):
+    """
+    Send images to model in one request, retrying transient API failures
+    with exponential backoff and full jitter
+    """
+    # Every attempt, including retries, counts against the rate limits. The
+    # limiters are waited on before taking a slot in semaphore, so requests
+    # held back by the rate limits do not block requests that could go ahead.
+    await wait_for_rate_limits(model, estimate_request_tokens(model, len(image_urls)))
+    
+    # Create message for GPT-4 Vision
+    async with semaphore:
+        return await client.chat.completions.create(
+            model=model,
+            messages=build_messages(image_urls),
+            max_tokens=MAX_OUTPUT_TOKENS
         )
-        
-        # Extract the response text
-        extracted_text = response.choices[0].message.content
-        return extracted_text.strip()
+
+async def extract_text_from_images(image_urls, model, semaphore):
+    """
+    Extract text from one or more images with a single request to model,
+    waiting for a free slot in semaphore. Returns one text per image (or None
+    if a batched response could not be split cleanly) and the request's
+    token usage.
+    """
+    response = await request_completion(image_urls, model, semaphore)
     
-    except Exception as e:
-        return f"Error processing {image_path}: {str(e)}"
+    # Extract the response text
+    choice = response.choices[0]
+    content = choice.message.content or ""
+    usage = response.usage.model_dump() if response.usage else None
+    if len(image_urls) == 1:
+        return [content.strip()], usage
+    if choice.finish_reason == 'length':
+        return None, usage
+    return split_batch_response(content, len(image_urls)), usage
+
+def recently_verified(key_hash):
+    """
+    Check whether this API key was verified within VERIFY_TTL_SECONDS
+    """
+    try:
+        if time.time() - os.path.getmtime(VERIFY_SENTINEL) > VERIFY_TTL_SECONDS:
+            return False
+        with open(VERIFY_SENTINEL, 'r', encoding='utf-8') as f:
+            return f.read() == key_hash
+    except OSError:
+        return False
 
-def check_environment():
+async def check_environment(verify=True):
     """
-    Check if the environment is properly set up
+    Check if the environment is properly set up. The API key is only tested
+    against the API when verify is set and it has not been checked recently.
     """
-    if not os.getenv('OPENAI_API_KEY'):
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
         raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
     
+    key_hash = hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest()
+    if not verify or recently_verified(key_hash):
+        return
+    
     # Test OpenAI client
     try:
-        client.models.list()
+        await client.models.list()
         print("✓ Successfully connected to OpenAI API")
     except Exception as e:
         raise Exception(f"Failed to connect to OpenAI API: {str(e)}")
+    
+    os.makedirs(os.path.dirname(VERIFY_SENTINEL), exist_ok=True)
+    with open(VERIFY_SENTINEL, 'w', encoding='utf-8') as f:
+        f.write(key_hash)
+
+def failed_result(entry, error):
+    """
+    Build the result row recording that an image could not be extracted
+    """
+    index, image_path, _ = entry
+    return index, f"Error processing {image_path}: {str(error)}", None
+
+async def process_batch(prepared, semaphore, pool, cache, batch, tier, total):
+    """
+    Extract text from a batch of (index, image_path, cache_keys) entries with
+    MODEL_TIERS[tier] once a preparation slot is free. A failure that may be
+    down to one image only affects that image. Images whose text fails
+    validation, or whose model is unavailable, move on to the next tier. Returns (index, text, model) tuples so results can be
+    reordered; model is None when the image could not be extracted.
+    """
+    model = MODEL_TIERS[tier]
+    last_tier = tier == len(MODEL_TIERS) - 1
+    results = []
+    error = None
+    async with prepared:
+        for index, image_path, _ in batch:
+            print(f"Processing {index}/{total} with {model}: {os.path.basename(image_path)}")
+        
+        # Encode each image on its own so an unreadable file only fails itself
+        encoded = await asyncio.gather(
+            *(image_url_for(image_path, pool) for _, image_path, _ in batch),
+            return_exceptions=True,
+        )
+        image_urls = []
+        requested = []
+        for entry, image_url in zip(batch, encoded):
+            if isinstance(image_url, Exception):
+                results.append(failed_result(entry, image_url))
+            else:
+                image_urls.append(image_url)
+                requested.append(entry)
+        batch = requested
+        if not batch:
+            return results
+        
+        try:
+            texts, usage = await extract_text_from_images(image_urls, model, semaphore)
+        except Exception as e:
+            error = e
+    
+    if error is not None:
+        if isinstance(error, MODEL_ERRORS) and not last_tier:
+            print(f"{model} failed ({error}), retrying {len(batch)} images with {MODEL_TIERS[tier + 1]}")
+            results.extend(await process_batch(prepared, semaphore, pool, cache, batch, tier + 1, total))
+        elif len(batch) > 1 and not isinstance(error, TRANSIENT_ERRORS + MODEL_ERRORS):
+            # The API may have rejected a single image; ask for each on its own
+            results.extend(await process_singles(prepared, semaphore, pool, cache, batch, tier, total))
+        else:
+            # Rate limits and outages outlasted the retries, or the request
+            # itself is bad; another model would not do better
+            results.extend(failed_result(entry, error) for entry in batch)
+        return results
+    
+    if texts is None:
+        # The model truncated or mixed up the batch; ask for each image on its own
+        results.extend(await process_singles(prepared, semaphore, pool, cache, batch, tier, total))
+        return results
+    
+    upgrades = []
+    for entry, extracted_text in zip(batch, texts):
+        index, image_path, cache_keys = entry
+        # usage covers the whole request, which batch_size images shared
+        cache.put(cache_keys[tier], {"text": extracted_text, "usage": usage, "batch_size": len(batch)})
+        if last_tier or validate_extraction(extracted_text):
+            results.append((index, extracted_text, model))
+        else:
+            print(f"Upgrading {os.path.basename(image_path)} to {MODEL_TIERS[tier + 1]}: output failed validation")
+            upgrades.append(entry)
+    
+    if upgrades:
+        results.extend(await process_batch(prepared, semaphore, pool, cache, upgrades, tier + 1, total))
+    return results
+
+async def process_singles(prepared, semaphore, pool, cache, batch, tier, total):
+    """
+    Retry every entry of a batch in its own request with MODEL_TIERS[tier]
+    """
+    singles = await asyncio.gather(*(
+        process_batch(prepared, semaphore, pool, cache, [entry], tier, total) for entry in batch
+    ))
+    return [result for single in singles for result in single]
 
-def main():
+async def main(verify=True):
     try:
         # Check environment setup
-        check_environment()
+        await check_environment(verify)
         
         # Create output directory if it doesn't exist
         output_dir = "extracted_text"
@@ -131,12 +518,12 @@ def main():
         
         # Get all image files from the images directory
         images_dir = "images"
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
         
         image_files = []
-        for file in os.listdir(images_dir):
-            if any(file.lower().endswith(ext) for ext in image_extensions):
-                image_files.append(os.path.join(images_dir, file))
+        with os.scandir(images_dir) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    image_files.append(entry.path)
         
         if not image_files:
             print("No image files found in the images directory.")
@@ -152,49 +539,137 @@ def main():
         print(f"Processing {len(image_files)} images...")
         print(f"Output will be saved to: {output_file}")
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("=" * 80 + "\n")
-            f.write("TEXT EXTRACTION FROM AUTOCLAVE IMAGES (GPT-4 Vision)\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"Extraction Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total Images Processed: {len(image_files)}\n")
-            f.write("=" * 80 + "\n\n")
-            
+        # Reuse previous results for identical image bytes, walking the model
+        # tiers the same way a fresh extraction would. Images still needing
+        # work are grouped by the tier they start at into batches of BATCH_SIZE.
+        cache = OCRCache(CACHE_PATH)
+        try:
+            cached_results = []
+            uncached = [[] for _ in MODEL_TIERS]
             for i, image_path in enumerate(image_files, 1):
-                print(f"Processing {i}/{len(image_files)}: {os.path.basename(image_path)}")
-                
-                # Extract text from image
-                extracted_text = extract_text_from_image(image_path)
+                cache_keys = image_cache_keys(image_path)
+                for tier, key in enumerate(cache_keys):
+                    cached = cache.get(key)
+                    if cached is None:
+                        uncached[tier].append((i, image_path, cache_keys))
+                        break
+                    if tier == len(MODEL_TIERS) - 1 or validate_extraction(cached["text"]):
+                        cached_results.append((i, cached["text"], MODEL_TIERS[tier]))
+                        break
+            batches = [
+                (tier, entries[start:start + BATCH_SIZE])
+                for tier, entries in enumerate(uncached)
+                for start in range(0, len(entries), BATCH_SIZE)
+            ]
+            
+            # Encode images across all CPU cores while up to MAX_CONCURRENCY
+            # requests are in flight; at most MAX_PREPARED batches are held at once
+            with ProcessPoolExecutor() as pool:
+                prepared = asyncio.Semaphore(MAX_PREPARED)
+                semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+                tasks = [
+                    asyncio.ensure_future(process_batch(prepared, semaphore, pool, cache, batch, tier, len(image_files)))
+                    for tier, batch in batches
+                ]
                 
-                # Write to file
-                f.write(f"IMAGE {i}: {os.path.basename(image_path)}\n")
-                f.write("-" * 60 + "\n")
-                f.write(extracted_text)
-                f.write("\n\n" + "=" * 80 + "\n\n")
+                try:
+                    # Only the compact per-image stats are kept for the summary
+                    summary_rows = []
+                    models_used = Counter()
+                    failed = 0
+                    # Files are written as pre-joined UTF-8 chunks, one write per section
+                    with open(output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+                        header = "\n".join([
+                            "=" * 80,
+                            "TEXT EXTRACTION FROM AUTOCLAVE IMAGES (GPT-4 Vision)",
+                            "=" * 80,
+                            f"Extraction Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                            f"Total Images Processed: {len(image_files)}",
+                            "=" * 80,
+                            "\n",
+                        ])
+                        f.write(header.encode('utf-8'))
+                        
+                        # Results arrive out of order; hold them in a heap until every
+                        # earlier image has been written
+                        pending = cached_results
+                        next_index = 1
+                        completed_batches = asyncio.as_completed(tasks)
+                        while next_index <= len(image_files):
+                            if not pending or pending[0][0] != next_index:
+                                # The next image to write is still in flight
+                                for result in await next(completed_batches):
+                                    heapq.heappush(pending, result)
+                                continue
+                            
+                            i, extracted_text, model = heapq.heappop(pending)
+                            if model is None:
+                                failed += 1
+                            else:
+                                models_used[model] += 1
+                            image_name = os.path.basename(image_files[i - 1])
+                            
+                            # Write to file
+                            section = "\n".join([
+                                f"IMAGE {i}: {image_name}",
+                                "-" * 60,
+                                extracted_text,
+                                "",
+                                "=" * 80,
+                                "\n",
+                            ])
+                            f.write(section.encode('utf-8'))
+                            
+                            word_count = len(extracted_text.split())
+                            char_count = len(extracted_text)
+                            summary_rows.append((i, image_name, word_count, char_count, extracted_text[:100]))
+                            next_index += 1
+                finally:
+                    # Stop outstanding requests if writing the results failed, and
+                    # let them unwind before the pool shuts down
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            cache.close()
         
         print(f"\nText extraction completed!")
         print(f"Results saved to: {output_file}")
         
+        upgraded = sum(models_used[model] for model in MODEL_TIERS[1:])
+        print(f"Upgraded {upgraded}/{len(image_files)} images beyond {MODEL_TIERS[0]} "
+              f"({', '.join(f'{model}: {models_used[model]}' for model in MODEL_TIERS)}, failed: {failed})")
+        
         # Create a summary file
         summary_file = os.path.join(output_dir, f"summary_{timestamp}.txt")
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            f.write("EXTRACTION SUMMARY\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Images processed: {len(image_files)}\n\n")
-            
-            for i, image_path in enumerate(image_files, 1):
-                extracted_text = extract_text_from_image(image_path)
-                word_count = len(extracted_text.split())
-                char_count = len(extracted_text)
-                
-                f.write(f"{i}. {os.path.basename(image_path)}\n")
-                f.write(f"   Words: {word_count}, Characters: {char_count}\n")
-                f.write(f"   Preview: {extracted_text[:100]}...\n\n")
+        with open(summary_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+            lines = [
+                "EXTRACTION SUMMARY",
+                "=" * 50,
+                f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                f"Images processed: {len(image_files)}",
+                "",
+            ]
+            for i, image_name, word_count, char_count, preview in summary_rows:
+                lines.append(f"{i}. {image_name}")
+                lines.append(f"   Words: {word_count}, Characters: {char_count}")
+                lines.append(f"   Preview: {preview}...")
+                lines.append("")
+            f.write(("\n".join(lines) + "\n").encode('utf-8'))
         
         print(f"Summary saved to: {summary_file}")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
+def parse_args():
+    """
+    Parse command line options
+    """
+    parser = argparse.ArgumentParser(description="Extract text from autoclave images using GPT-4 Vision")
+    parser.add_argument('--no-verify', action='store_true',
+                        help="skip testing the API key against the OpenAI API before processing")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    asyncio.run(main(verify=not args.no_verify))
\ No newline at end of file